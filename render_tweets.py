@@ -0,0 +1,29 @@
+import sys
+
+from twimg import ENTRY_SEPARATOR, JSONL_PATH, MISSING_LABELS, TXT_PATH, load_local_tweets
+
+def render_tweets_txt(tweets, output_path):
+    """ツイートのリスト (新しい順) を閲覧用のtweets.txtに書き出す"""
+    with open(output_path, "w", encoding="utf-8") as f:
+        for tweet in tweets:
+            # 値がNoneの項目だけを表示用の文字列に置き換える (空文字はそのまま)
+            user_info, timestamp, text = (
+                MISSING_LABELS[key] if tweet[key] is None else tweet[key]
+                for key in ("user_info", "timestamp", "text")
+            )
+            f.write(f"User: {user_info}\n")
+            f.write(f"Time: {timestamp}\n")
+            f.write(f"Text: {text}\n")
+            f.write(ENTRY_SEPARATOR)
+    print(f"Rendered {len(tweets)} tweets to {output_path}")
+
+
+if __name__ == "__main__":
+    # 保存用のtweets.jsonlから閲覧用のtweets.txtを生成する
+    try:
+        render_tweets_txt(load_local_tweets(JSONL_PATH), TXT_PATH)
+    except FileNotFoundError:
+        print(f"{JSONL_PATH} not found. Nothing to render.")
+    except Exception as e:
+        print(f"Failed: {e}")
+        sys.exit(1)
@@ -1,51 +1,145 @@
 import base64
+import collections
+import functools
 import os
 import sys
 import asyncio
 import json
-import requests
+import aiohttp
 import re
 import random
 
 from playwright.async_api import async_playwright
 
-def load_existing_tweets(file_url):
-    """GitHub Pagesから既存のtweets.txtを読み込み、パースしてリストで返す"""
+# まだ読み取っていないarticle
+NEW_TWEETS_SELECTOR = 'article[data-testid="tweet"]:not([data-scraped])'
+
+# まだ読み取っていないarticleからユーザー名・本文・時刻をまとめて取り出すJS
+# (読み取ったarticleには印を付け、次回以降のスクロールでは対象外にする)
+EXTRACT_TWEETS_JS = """
+(selector) => Array.from(document.querySelectorAll(selector), a => {
+    a.dataset.scraped = '1';
+    return {
+        user_info: a.querySelector('[data-testid="User-Name"]')?.innerText ?? null,
+        text: a.querySelector('[data-testid="tweetText"]')?.innerText ?? null,
+        timestamp: a.querySelector('time')?.getAttribute('datetime') ?? null
+    };
+})
+"""
+
+# navigator.webdriver を隠すための初期化スクリプト
+WEBDRIVER_JS = """
+Object.defineProperty(navigator, 'webdriver', {
+    get: () => undefined
+});
+"""
+
+# 1回のスクレイピング中に覚えておく署名の上限 (古いものから捨てる)
+SEEN_SIGS_MAXLEN = 5000
+
+# 取得しないリソースの種類
+# (innerTextはレイアウトに依存するのでスタイルシートは読み込む)
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+# 出力先
+OUTPUT_DIR = "public"
+JSONL_PATH = os.path.join(OUTPUT_DIR, "tweets.jsonl")
+TXT_PATH = os.path.join(OUTPUT_DIR, "tweets.txt")
+
+# 値が無い項目をtweets.txtに表示するときの文字列
+MISSING_LABELS = {
+    "user_info": "(No User)",
+    "timestamp": "(No Time)",
+    "text": "(No Text)",
+}
+
+# 旧形式 (tweets.txt) のパース用正規表現
+ENTRY_SEPARATOR = "-" * 20 + "\n"
+USER_RE = re.compile(r"User: (.*)")
+TIME_RE = re.compile(r"Time: (.*)")
+# Textは複数行の可能性があるので、Timeの後から最後までを取得
+TEXT_RE = re.compile(r"Text: ([\s\S]*)")
+
+def parse_tweets_jsonl(content):
+    """tweets.jsonl (1行1ツイートのJSON、古い順) をパースして新しい順のリストで返す"""
+    # splitlines()はU+2028等でも分割してしまうので、改行文字だけで分割する
+    tweets = [json.loads(line) for line in content.split("\n") if line.strip()]
+    tweets.reverse()
+    return tweets
+
+def load_local_tweets(path):
+    """ローカルのtweets.jsonlを読み込み、新しい順のリストで返す"""
+    with open(path, encoding="utf-8") as f:
+        tweets = parse_tweets_jsonl(f.read())
+    print(f"Loaded {len(tweets)} existing tweets from {path}.")
+    return tweets
+
+def parse_tweets_txt(content):
+    """旧形式のtweets.txtをパースしてリストで返す"""
+    tweets = []
+    # 区切り線で分割
+    raw_entries = content.split(ENTRY_SEPARATOR)
+    
+    for entry in raw_entries:
+        if not entry.strip():
+            continue
+        
+        user_match = USER_RE.search(entry)
+        time_match = TIME_RE.search(entry)
+        text_match = TEXT_RE.search(entry)
+        
+        if user_match and time_match and text_match:
+            tweet = {
+                "user_info": user_match.group(1).strip(),
+                "timestamp": time_match.group(1).strip(),
+                "text": text_match.group(1).strip()
+            }
+            # 表示用の文字列はNoneに戻す
+            for key, label in MISSING_LABELS.items():
+                if tweet[key] == label:
+                    tweet[key] = None
+            tweets.append(tweet)
+    return tweets
+
+async def fetch_text(session, url):
+    """URLの内容を文字列で返す。取得できなければNone"""
+    print(f"Fetching existing tweets from {url}...")
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+        if resp.status != 200:
+            print(f"No existing tweets found (Status: {resp.status}).")
+            return None
+        return await resp.text()
+
+async def load_existing_tweets(file_url):
+    """GitHub Pagesから既存のtweets.jsonlを読み込み、パースしてリストで返す"""
     if not file_url:
         return []
     
-    print(f"Fetching existing tweets from {file_url}...")
     try:
-        resp = requests.get(file_url, timeout=10)
-        if resp.status_code != 200:
-            print(f"No existing tweets found (Status: {resp.status_code}). Starting fresh.")
-            return []
-        
-        content = resp.text
-        tweets = []
-        # 区切り線で分割
-        raw_entries = content.split("-" * 20 + "\n")
-        
-        for entry in raw_entries:
-            if not entry.strip():
-                continue
-            
-            user_match = re.search(r"User: (.*)", entry)
-            time_match = re.search(r"Time: (.*)", entry)
-            # Textは複数行の可能性があるので、Timeの後から最後までを取得
-            text_match = re.search(r"Text: ([\s\S]*)", entry)
-            
-            if user_match and time_match and text_match:
-                tweets.append({
-                    "user_info": user_match.group(1).strip(),
-                    "timestamp": time_match.group(1).strip(),
-                    "text": text_match.group(1).strip()
-                })
-        print(f"Loaded {len(tweets)} existing tweets.")
-        return tweets
+        async with aiohttp.ClientSession() as session:
+            content = await fetch_text(session, file_url)
+            is_jsonl = file_url.endswith(".jsonl")
+            if content is None and is_jsonl:
+                # JSONLがまだ無い場合は旧形式のtweets.txtから移行する
+                legacy_url = file_url[:-len(".jsonl")] + ".txt"
+                content = await fetch_text(session, legacy_url)
+                is_jsonl = False
     except Exception as e:
         print(f"Failed to load existing tweets: {e}")
         return []
+    
+    if content is None:
+        print("Starting fresh.")
+        return []
+    
+    # パースの失敗は「データ無し」とは扱わない
+    # (空として続行すると既存のデータを上書きしてしまうので、そのまま例外を投げる)
+    if is_jsonl:
+        tweets = parse_tweets_jsonl(content)
+    else:
+        tweets = parse_tweets_txt(content)
+    print(f"Loaded {len(tweets)} existing tweets.")
+    return tweets
 
 async def human_like_behavior(page):
     """人間らしいランダムな動きをシミュレート"""
@@ -57,168 +151,279 @@ async def human_like_behavior(page):
     # ほんの少し待機
     await page.wait_for_timeout(random.randint(500, 1500))
 
-async def scrape_twitter(url: str, scroll_count: int = 5):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True,
-            args=[
-                "--no-sandbox",
-                "--disable-setuid-sandbox",
-                "--disable-dev-shm-usage",
-            ],
+def remember_sig(seen_sigs, sig):
+    """未登録の署名なら登録してTrueを返す。上限を超えたら古いものから捨てる"""
+    if sig in seen_sigs:
+        seen_sigs.move_to_end(sig)
+        return False
+    seen_sigs[sig] = None
+    if len(seen_sigs) > SEEN_SIGS_MAXLEN:
+        seen_sigs.popitem(last=False)
+    return True
+
+async def wait_for_new_tweets(page, timeout=4000, poll_interval=200, stable_checks=2):
+    """未読のarticleが現れ、その後しばらく件数が変化しなくなるまで待機"""
+    # 画面外のarticleはDOMから外されるので、総数ではなく未読のarticleの有無で判定する
+    try:
+        await page.wait_for_function(
+            "(selector) => document.querySelector(selector) !== null",
+            arg=NEW_TWEETS_SELECTOR,
+            timeout=timeout,
         )
-        
-        # 認証情報の読み込みロジック
-        storage_state = None
-        if os.path.exists("auth.json"):
-            print("Found auth.json, loading...")
-            storage_state = "auth.json"
-        elif os.environ.get("TWITTER_AUTH_JSON"):
-            print("Found TWITTER_AUTH_JSON env var, loading...")
-            try:
-                # 環境変数が生JSONかBase64か判別してロード
-                env_val = os.environ["TWITTER_AUTH_JSON"]
-                try:
-                    storage_state = json.loads(env_val)
-                except json.JSONDecodeError:
-                    decoded = base64.b64decode(env_val).decode("utf-8")
-                    storage_state = json.loads(decoded)
-            except Exception as e:
-                print(f"Failed to load auth from env: {e}")
-
-        if storage_state:
-            context = await browser.new_context(
-                storage_state=storage_state,
-                viewport={"width": 1280, "height": 800},
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                locale="ja-JP",
-            )
+    except Exception:
+        # 新しいツイートが来なくてもそのまま続行
+        return
+
+    # 未読の件数がstable_checks回連続で変わらなくなるまでポーリング
+    last_count = await page.locator(NEW_TWEETS_SELECTOR).count()
+    stable = 0
+    for _ in range(timeout // poll_interval):
+        await page.wait_for_timeout(poll_interval)
+        count = await page.locator(NEW_TWEETS_SELECTOR).count()
+        if count == last_count:
+            stable += 1
+            if stable >= stable_checks:
+                break
         else:
-            print("Warning: auth.json not found!")
-            context = await browser.new_context(locale="ja-JP")
-        
-        page = await context.new_page()
-        await page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-        """)
+            last_count = count
+            stable = 0
 
+@functools.lru_cache(maxsize=1)
+def load_storage_state():
+    """auth.json または環境変数 TWITTER_AUTH_JSON から認証情報を読み込む (結果はキャッシュ)"""
+    storage_state = None
+    if os.path.exists("auth.json"):
+        print("Found auth.json, loading...")
+        storage_state = "auth.json"
+    elif os.environ.get("TWITTER_AUTH_JSON"):
+        print("Found TWITTER_AUTH_JSON env var, loading...")
         try:
-            print(f"Accessing: {url}")
-            await page.goto(url, wait_until="commit", timeout=10000)
+            # 環境変数が生JSONかBase64かを先頭の文字で判別してロード
+            env_val = os.environ["TWITTER_AUTH_JSON"].strip()
+            if env_val.startswith("{"):
+                storage_state = json.loads(env_val)
+            else:
+                decoded = base64.b64decode(env_val).decode("utf-8")
+                storage_state = json.loads(decoded)
+        except Exception as e:
+            print(f"Failed to load auth from env: {e}")
+    return storage_state
+
+async def block_heavy_resources(route):
+    """BLOCKED_RESOURCE_TYPES のリクエストを中断し、それ以外はそのまま通す"""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def scrape_one(browser, url: str, storage_state, scroll_count: int = 5):
+    """起動済みのブラウザ上に専用のcontextを作り、1つのURLをスクレイピングする"""
+    if storage_state:
+        context = await browser.new_context(
+            storage_state=storage_state,
+            viewport={"width": 1280, "height": 800},
+            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            locale="ja-JP",
+            service_workers="block",
+        )
+    else:
+        print("Warning: auth.json not found!")
+        context = await browser.new_context(locale="ja-JP", service_workers="block")
+    
+    # context単位で登録し、このcontextの全ページに適用する
+    await context.add_init_script(WEBDRIVER_JS)
+    
+    # テキストしか使わないので画像・動画・フォントは読み込まない
+    # (Service Worker経由のリクエストはrouteで捕まらないので、contextでSWを無効にしている)
+    await context.route("**/*", block_heavy_resources)
+    
+    page = await context.new_page()
+
+    try:
+        print(f"Accessing: {url}")
+        await page.goto(url, wait_until="commit", timeout=10000)
+        
+        # 初期待機も少しランダムに
+        await page.wait_for_timeout(random.randint(2000, 4000))
+        
+        try:
+            await page.wait_for_selector("article", timeout=15000)
+        except:
+            print("Element wait timeout (Might be OK if content loaded)")
+
+        tweets_data = []
+        seen_tweet_sigs = collections.OrderedDict()
+
+        def collect(results):
+            for r in results:
+                user_info = r["user_info"]
+                text = r["text"]
+                timestamp = r["timestamp"]
+
+                # 投稿者と時刻でツイートを識別する (本文は連結しない)
+                sig = (user_info, timestamp)
+
+                if remember_sig(seen_tweet_sigs, sig):
+                    tweets_data.append({
+                        "user_info": user_info.replace("\n", " ") if user_info else user_info,
+                        "text": text,
+                        "timestamp": timestamp
+                    })
+
+        for i in range(scroll_count):
+            print(f"[{url}] Scrolling {i+1}/{scroll_count}...")
+            
+            # スクロール前にマウスを少し動かす
+            await human_like_behavior(page)
             
-            # 初期待機も少しランダムに
-            await page.wait_for_timeout(random.randint(2000, 4000))
+            # --- ツイート抽出処理 ---
+            # 画面外のarticleはDOMから外されるので、スクロールごとに
+            # 未読のarticleだけを1回のevaluateで抽出する
+            collect(await page.evaluate(EXTRACT_TWEETS_JS, NEW_TWEETS_SELECTOR))
+            
+            # ランダムな量だけスクロール
+            # ホイール入力を経由せず、直接スクロール位置を動かす
+            scroll_amount = random.randint(1200, 2500)
+            await page.evaluate(
+                "(dy) => window.scrollBy({top: dy, behavior: 'instant'})",
+                scroll_amount,
+            )
             
-            try:
-                await page.wait_for_selector("article", timeout=15000)
-            except:
-                print("Element wait timeout (Might be OK if content loaded)")
+            # 固定時間ではなく、新しいツイートが読み込まれるまで待機
+            await wait_for_new_tweets(page)
 
-            tweets_data = []
-            seen_tweet_sigs = set()
+        # 最後のスクロールで読み込まれた分
+        collect(await page.evaluate(EXTRACT_TWEETS_JS, NEW_TWEETS_SELECTOR))
 
-            for i in range(scroll_count):
-                print(f"Scrolling {i+1}/{scroll_count}...")
-                
-                # スクロール前にマウスを少し動かす
-                await human_like_behavior(page)
-                
-                # --- ツイート抽出処理 ---
-                articles = await page.locator('article[data-testid="tweet"]').all()
-                for article in articles:
-                    try:
-                        user_name_locator = article.locator('[data-testid="User-Name"]')
-                        user_info = await user_name_locator.inner_text() if await user_name_locator.count() > 0 else "(No User)"
-                        
-                        text_locator = article.locator('[data-testid="tweetText"]')
-                        text = await text_locator.inner_text() if await text_locator.count() > 0 else "(No Text)"
-                        
-                        time_locator = article.locator('time')
-                        timestamp = await time_locator.get_attribute("datetime") if await time_locator.count() > 0 else "(No Time)"
-
-                        sig = f"{user_info}_{timestamp}_{text}"
-                        
-                        if sig not in seen_tweet_sigs:
-                            seen_tweet_sigs.add(sig)
-                            tweets_data.append({
-                                "user_info": user_info.replace("\n", " "),
-                                "text": text,
-                                "timestamp": timestamp
-                            })
-                    except Exception as e:
-                        continue
-                
-                # ランダムな量だけスクロール
-                scroll_amount = random.randint(1200, 2500)
-                await page.mouse.wheel(0, scroll_amount)
-                
-                # 待機時間もランダムに (2秒〜4秒)
-                await page.wait_for_timeout(random.randint(2000, 4000))
+        print(f"[{url}] Total unique tweets collected in this session: {len(tweets_data)}")
+        return tweets_data
 
-            print(f"Total unique tweets collected in this session: {len(tweets_data)}")
-            return tweets_data
+    except Exception as e:
+        print(f"[{url}] Error: {e}")
+        raise e
+    finally:
+        await context.close()
 
-        except Exception as e:
-            print(f"Error: {e}")
-            raise e
+async def scrape_twitter_many(urls, scroll_count: int = 5):
+    """ブラウザを1回だけ起動し、複数URLを並行してスクレイピングする"""
+    async with async_playwright() as p:
+        cdp_url = os.environ.get("CDP_URL")
+        if cdp_url:
+            # 起動済みのChromiumに接続して起動コストを省く
+            # (close()しても接続が切れるだけでブラウザ自体は残る)
+            print(f"Connecting to running browser at {cdp_url}...")
+            browser = await p.chromium.connect_over_cdp(cdp_url)
+        else:
+            browser = await p.chromium.launch(
+                headless=True,
+                args=[
+                    "--no-sandbox",
+                    "--disable-setuid-sandbox",
+                    "--disable-dev-shm-usage",
+                ],
+            )
+        
+        # 認証情報は1回だけ読み込んで全contextで共有
+        storage_state = load_storage_state()
+
+        try:
+            # 1つのURLが失敗しても他のURLの結果は残す (失敗したURLは例外が入る)
+            results = await asyncio.gather(
+                *[scrape_one(browser, url, storage_state, scroll_count) for url in urls],
+                return_exceptions=True,
+            )
         finally:
             await browser.close()
 
+    for url, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            print(f"Failed to scrape {url}: {result}")
+    return results
+
+async def scrape_twitter(url: str, scroll_count: int = 5):
+    results = await scrape_twitter_many([url], scroll_count)
+    if isinstance(results[0], BaseException):
+        raise results[0]
+    return results[0]
+
+async def fetch_all(urls, existing_data_url, use_local_store=False):
+    """スクレイピングと既存データの取得を並行して実行する"""
+    if use_local_store:
+        # ローカルに保存済みのデータを使う
+        if existing_data_url:
+            print(f"Using local {JSONL_PATH} instead of EXISTING_DATA_URL ({existing_data_url}).")
+        return await asyncio.gather(
+            scrape_twitter_many(urls),
+            asyncio.to_thread(load_local_tweets, JSONL_PATH),
+        )
+    return await asyncio.gather(
+        scrape_twitter_many(urls),
+        load_existing_tweets(existing_data_url),
+    )
+
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
-        target_url = sys.argv[1]
+        target_urls = sys.argv[1:]
         existing_data_url = os.getenv("EXISTING_DATA_URL", "") # 環境変数から既存データのURLを取得
         
-        print(f"Running for URL: {target_url}")
+        print(f"Running for URLs: {', '.join(target_urls)}")
         
         try:
-            # 1. 新しいツイートを取得
-            new_tweets = asyncio.run(scrape_twitter(target_url))
+            # ローカルにtweets.jsonlがあれば、新しい分だけを追記する
+            append_only = os.path.exists(JSONL_PATH)
             
-            # 2. 既存のツイートを取得
-            existing_tweets = load_existing_tweets(existing_data_url)
+            # 1. 新しいツイートと 2. 既存のツイートを並行して取得
+            results, existing_tweets = asyncio.run(
+                fetch_all(target_urls, existing_data_url, append_only)
+            )
+            # 全URLが失敗した場合のみエラーにする
+            succeeded = [r for r in results if not isinstance(r, BaseException)]
+            if not succeeded:
+                raise RuntimeError("All URLs failed to scrape")
+            
+            # 成功したURLの結果をURLの順に連結
+            new_tweets = [t for tweets in succeeded for t in tweets]
             
             # 3. マージと重複排除
             # 既存のツイートを署名のセットに追加
             seen_sigs = set()
             for t in existing_tweets:
-                sig = f"{t['user_info']}_{t['timestamp']}_{t['text']}"
+                sig = (t['user_info'], t['timestamp'])
                 seen_sigs.add(sig)
             
-            merged_tweets = list(existing_tweets)
-            added_count = 0
-            
-            # 新しいツイートを追加（重複していないものだけ）
-            # 新しいものほど上に来るようにしたい場合は、リストの先頭に追加するか、
-            # タイムスタンプでソートする等の工夫が必要。今回は単純に追加。
+            # 新しいツイートのうち重複していないものだけを集める
             # 通常、スクレイピングは新しい順に取れることが多いので、
-            # 既存リストの「前」に追加する形にする。
-            
+            # 取得順のまま既存リストの「前」に連結する（1回の連結で済ませる）
+            new_unique = []
             for t in new_tweets:
-                sig = f"{t['user_info']}_{t['timestamp']}_{t['text']}"
+                sig = (t['user_info'], t['timestamp'])
                 if sig not in seen_sigs:
-                    merged_tweets.insert(0, t) # 先頭に追加
+                    new_unique.append(t)
                     seen_sigs.add(sig)
-                    added_count += 1
+            
+            merged_tweets = new_unique + existing_tweets
+            added_count = len(new_unique)
             
             print(f"Merged {added_count} new tweets. Total: {len(merged_tweets)}")
             
             # 4. 保存
             if merged_tweets:
-                output_dir = "public"
-                os.makedirs(output_dir, exist_ok=True)
+                os.makedirs(OUTPUT_DIR, exist_ok=True)
                 
-                output_path = os.path.join(output_dir, "tweets.txt")
-                with open(output_path, "w", encoding="utf-8") as f:
-                    for tweet in merged_tweets:
-                        f.write(f"User: {tweet['user_info']}\n")
-                        f.write(f"Time: {tweet['timestamp']}\n")
-                        f.write(f"Text: {tweet['text']}\n")
-                        f.write("-" * 20 + "\n")
-                print(f"Saved total {len(merged_tweets)} tweets to {output_path}")
+                # 保存用の本体はJSONL (1行1ツイート、古い順)
+                # 新しいツイートは末尾に追記するだけで済む
+                if append_only:
+                    with open(JSONL_PATH, "a", encoding="utf-8") as f:
+                        for tweet in reversed(new_unique):
+                            f.write(json.dumps(tweet, ensure_ascii=False) + "\n")
+                    print(f"Appended {added_count} tweets to {JSONL_PATH}")
+                else:
+                    with open(JSONL_PATH, "w", encoding="utf-8") as f:
+                        for tweet in reversed(merged_tweets):
+                            f.write(json.dumps(tweet, ensure_ascii=False) + "\n")
+                    print(f"Saved total {len(merged_tweets)} tweets to {JSONL_PATH}")
+                # 閲覧用のtweets.txtは render_tweets.py で別途生成する
             else:
                 print("No tweets to save.")
 
@@ -226,5 +431,5 @@ if __name__ == "__main__":
             print(f"Failed: {e}")
             sys.exit(1)
     else:
-        print("Usage: python twimg.py <URL>")
+        print("Usage: python twimg.py <URL> [<URL> ...]")
         sys.exit(1)
\ No newline at end of file